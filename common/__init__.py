@@ -0,0 +1,3 @@
+""" Helpers shared by the pipeline Lambdas. Deployed once as the wine-quality-common Lambda layer
+    (under python/common/) and imported by every function that uses them.
+"""
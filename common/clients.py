@@ -0,0 +1,46 @@
+""" Setup of the botocore clients created by the pipeline Lambdas
+"""
+
+import botocore.session
+from botocore.config import Config
+
+# Configuration of every client unless overridden. TCP keep-alive stops idle pooled connections
+# from being dropped between warm invocations.
+DEFAULT_CONFIG = Config(
+    tcp_keepalive=True,
+    retries={'mode': 'standard', 'max_attempts': 3},
+    max_pool_connections=10
+)
+
+# Overrides for the clients of the functions that start the pipelines. Adaptive retries absorb
+# SageMaker's 'Rate exceeded' throttling when pipelines launch jobs in bursts.
+BURST_CLIENT_OPTIONS = {'retries': {'mode': 'adaptive', 'max_attempts': 10}, 'max_pool_connections': 50}
+
+# One session per execution environment, so its clients share the loaded service models
+session = botocore.session.get_session()
+
+def create_client(service_name, **config_options):
+    '''
+    Creates a client configured with DEFAULT_CONFIG, where the given botocore Config options
+    override it. Modules create their clients at import time, so they are created once per
+    execution environment and reused on warm invocations.
+    '''
+    config = DEFAULT_CONFIG.merge(Config(**config_options)) if config_options else DEFAULT_CONFIG
+    return session.create_client(service_name, config=config)
+
+def warm_operation_models(client, *operation_names, paginators=()):
+    '''
+    Resolves the request models of the given operations, and loads the paginators of the given
+    methods, while the execution environment initializes. botocore otherwise parses them on their
+    first use, which would be paid by the first invocation.
+
+    Returns the resolved members of each operation's input shape
+    '''
+    service_model = client.meta.service_model
+    input_members = {
+        operation_name: service_model.operation_model(operation_name).input_shape.members
+        for operation_name in operation_names
+    }
+    for method_name in paginators:
+        client.can_paginate(method_name)
+    return input_members
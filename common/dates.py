@@ -0,0 +1,14 @@
+""" Timestamps used in job names and metadata keys
+"""
+
+import datetime
+from zoneinfo import ZoneInfo
+
+# Job names and metadata keys are stamped with Madrid local time, DST included
+MADRID_TZ = ZoneInfo('Europe/Madrid')
+
+def madrid_timestamp():
+    '''
+    Returns the current Madrid time formatted as the '%m-%d-%H%M%S' suffix of job names and keys
+    '''
+    return datetime.datetime.now(MADRID_TZ).strftime('%m-%d-%H%M%S')
@@ -0,0 +1,75 @@
+""" Shared logic of the get-*-job-status Lambdas. Every entry point delegates the SageMaker
+    describe call to this module, so all of them share one client and one connection pool.
+"""
+
+import logging
+import os
+from .clients import create_client
+from .logs import get_logger
+
+logger = get_logger(__name__)
+
+# Set LOG_HTTP_CONNECTIONS to log every new HTTPS connection; on warm polls none should appear
+if os.environ.get('LOG_HTTP_CONNECTIONS'):
+    logging.getLogger('urllib3.connectionpool').setLevel(logging.DEBUG)
+
+# Keep the HTTPS connection alive between polls from the Step Functions loop. Adaptive retries
+# also rate limit the client when SageMaker starts throttling the describe calls.
+sm_client = create_client('sagemaker', retries={'mode': 'adaptive', 'max_attempts': 3}, max_pool_connections=20)
+
+# Job kind -> (describe method, job name parameter, status field)
+DESCRIBERS = {
+    'processing': ('describe_processing_job', 'ProcessingJobName', 'ProcessingJobStatus'),
+    'hpo': ('describe_hyper_parameter_tuning_job', 'HyperParameterTuningJobName', 'HyperParameterTuningJobStatus'),
+    'training': ('describe_training_job', 'TrainingJobName', 'TrainingJobStatus'),
+    'transform': ('describe_transform_job', 'TransformJobName', 'TransformJobStatus')
+}
+
+# Seconds the state machine should wait before polling again, by job status. Terminal statuses
+# need no further polls; anything else (e.g. an empty debug status) uses the default.
+TERMINAL_STATUSES = {'Completed', 'Failed', 'Stopped', 'DeleteFailed'}
+POLL_DELAYS = {'InProgress': 60, 'Stopping': 5, 'Deleting': 5}
+DEFAULT_POLL_DELAY = 10
+
+def suggest_poll_delay(status):
+    '''
+    Returns the recommended delay before the next status poll, read by the Wait state through
+    "SecondsPath": "$.next_poll_seconds"
+    '''
+    if status in TERMINAL_STATUSES:
+        return 0
+    return POLL_DELAYS.get(status, DEFAULT_POLL_DELAY)
+
+# Final statuses never change, so once seen they are answered without calling SageMaker. A failed
+# delete can be retried, which takes the job back to 'Deleting', so 'DeleteFailed' isn't cached.
+# Only the most recently cached jobs are kept.
+CACHED_STATUSES = TERMINAL_STATUSES - {'DeleteFailed'}
+MAX_CACHED_STATUSES = 256
+terminal_status_cache = {}
+
+def get_job_status(kind, job_name):
+    '''
+    Queries SageMaker for the status of a processing, hpo, training or transform job
+    '''
+    cached_status = terminal_status_cache.get((kind, job_name))
+    if cached_status:
+        logger.info(f"{kind.capitalize()} job: '{job_name}' has cached terminal status: '{cached_status}'.")
+        return cached_status
+
+    describe_method, name_parameter, status_field = DESCRIBERS[kind]
+    try:
+        response = getattr(sm_client, describe_method)(**{name_parameter: job_name})
+        status = response[status_field]
+        logger.info(f"{kind.capitalize()} job: '{job_name}' has status: '{status}'.")
+        if status in CACHED_STATUSES:
+            if len(terminal_status_cache) >= MAX_CACHED_STATUSES:
+                del terminal_status_cache[next(iter(terminal_status_cache))]
+            terminal_status_cache[(kind, job_name)] = status
+        return status
+    except Exception as e:
+        response = (f'Failed to read {kind} status!'+
+                    f' The {kind} job may not exist or the job name may be incorrect.'+
+                    ' Check SageMaker to confirm the job name.')
+        logger.error(e)
+        logger.warning(f'{response} Attempted to read job name: {job_name}.')
+        raise
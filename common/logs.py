@@ -0,0 +1,15 @@
+""" Logging setup of the pipeline Lambdas
+"""
+
+import logging
+import os
+
+def get_logger(name):
+    '''
+    Returns the logger of a module. When the function sets a log level (AWS_LAMBDA_LOG_LEVEL) the
+    runtime applies it to the root logger, which module loggers inherit; otherwise they log at INFO
+    '''
+    logger = logging.getLogger(name)
+    if 'AWS_LAMBDA_LOG_LEVEL' not in os.environ:
+        logger.setLevel(logging.INFO)
+    return logger
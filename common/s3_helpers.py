@@ -0,0 +1,125 @@
+""" S3 reads and writes shared by the launchers and the save-* lambdas
+"""
+
+import json
+import copy
+from typing import Dict, Any
+from botocore.exceptions import ClientError
+from .logs import get_logger
+
+logger = get_logger(__name__)
+
+# Copy of the newest metadata file that the save-* lambdas keep under their prefix
+LATEST_METADATA_NAME = 'latest.json'
+
+# Parsed config files per (bucket, key) with their ETag. Warm invocations revalidate them with a
+# conditional GET, so a config is only downloaded and parsed again after it changes.
+config_cache = {}
+
+def get_config_data(s3_client, bucket: str, key: str) -> Dict[str, Any]:
+    '''
+    This function downloads a file from the specified S3 bucket and key and then parses 
+    it into a Python dictionary. Callers get their own copy of the cached config.
+
+    Retreives a config file
+    '''
+    cached = config_cache.get((bucket, key))
+    try:
+        if cached:
+            config_object = s3_client.get_object(Bucket=bucket, Key=key, IfNoneMatch=cached[0])
+        else:
+            config_object = s3_client.get_object(Bucket=bucket, Key=key)
+        # Closing the body returns its connection to the pool even when parsing fails
+        with config_object['Body'] as body:
+            config_data = json.load(body)
+        config_cache[(bucket, key)] = (config_object['ETag'], config_data)
+        return copy.deepcopy(config_data)
+    except s3_client.exceptions.NoSuchKey:
+        logger.error(f"Configuration file not found: {key}")
+        raise
+    except ClientError as e:
+        # 304 Not Modified: the cached copy is still current
+        if cached and e.response['ResponseMetadata']['HTTPStatusCode'] == 304:
+            return copy.deepcopy(cached[1])
+        logger.error(f"Error fetching or parsing the configuration file from S3: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching or parsing the configuration file from S3: {e}")
+        raise
+
+def get_last_modified_key(s3_client, bucket: str, prefix: str) -> str:
+    '''
+    Returns the key of the last modified object (AKA: the last added object) under a prefix.
+    Every page of the listing is scanned keeping only the newest object, instead of sorting all
+    of them. Raises KeyError('Contents') if the prefix is empty.
+    '''
+    last_object = None
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if last_object is None or obj['LastModified'] >= last_object['LastModified']:
+                last_object = obj
+    if last_object is None:
+        raise KeyError('Contents')
+    return last_object['Key']
+
+def latest_metadata_key(prefix: str) -> str:
+    '''
+    Returns the key of the latest.json copy kept under a metadata prefix
+    '''
+    return f"{prefix.rstrip('/')}/{LATEST_METADATA_NAME}"
+
+def put_metadata(s3_client, bucket: str, key: str, metadata: Dict[str, Any], keep_latest: bool = False):
+    '''
+    Uploads a metadata file. With keep_latest, a copy is also written as latest.json under the
+    same prefix, so the launchers can read the newest metadata with one GET instead of listing
+    the prefix; the source key travels as object metadata.
+    '''
+    # Compact separators: the metadata is read by the other lambdas, not by people
+    body = json.dumps(metadata, default=str, separators=(',', ':')).encode('utf-8')
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=body,
+        ContentType='application/json',
+        ChecksumAlgorithm='CRC32'
+    )
+    if keep_latest:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=latest_metadata_key(key.rsplit('/', 1)[0]),
+            Body=body,
+            Metadata={'source-key': key},
+            ContentType='application/json',
+            ChecksumAlgorithm='CRC32'
+        )
+
+def get_latest_metadata(s3_client, bucket: str, prefix: str):
+    '''
+    This function identifies the most recent metadata file under a prefix, and then downloads and
+    parses it into a Python dictionary. The latest.json copy kept by the save-* lambdas is read with
+    a single GET; only prefixes without one are listed.
+
+    Returns the metadata and the key of the timestamped file it was written as
+    '''
+    latest_key = latest_metadata_key(prefix)
+    try:
+        metadata_object = s3_client.get_object(Bucket=bucket, Key=latest_key)
+        with metadata_object['Body'] as body:
+            metadata_json = json.load(body)
+        return metadata_json, metadata_object['Metadata'].get('source-key', latest_key)
+    except s3_client.exceptions.NoSuchKey:
+        logger.info(f"No {LATEST_METADATA_NAME} under prefix: {prefix}, listing it instead")
+
+    try:
+        last_object_key = get_last_modified_key(s3_client, bucket, prefix)
+        metadata_object = s3_client.get_object(Bucket=bucket, Key=last_object_key)
+        with metadata_object['Body'] as body:
+            metadata_json = json.load(body)
+        return metadata_json, last_object_key
+    except s3_client.exceptions.NoSuchKey:
+        logger.error(f"Metadata file not found with prefix: {prefix}")
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching metadata from S3: {e}")
+        raise
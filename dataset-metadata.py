@@ -1,53 +1,264 @@
-import json
-from datetime import datetime
-import pandas as pd
+import os
+from hashlib import blake2b
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pac
+from common.clients import create_client
+from common.logs import get_logger
+
+logger = get_logger(__name__)
+
+s3_client = create_client('s3')
+
+# Duplicate detection keeps a fixed-size digest per row, which is held about three times over while
+# the digests are sorted. Above this many rows, the digests would need more than an eighth of the
+# function's memory, so the check is skipped.
+ROW_DIGEST_SIZE = 16
+MAX_DUPLICATE_ROWS = int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', 1769)) * 2**20 // 8 // (3 * ROW_DIGEST_SIZE)
+
+# Statistics of pandas' describe(), in its order
+DESCRIBE_STATISTICS = ('count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max')
+
+# Bytes of the S3 body parsed per record batch; bounds the memory held by the streaming reader
+CSV_BLOCK_SIZE = 8 << 20
+
+def is_numeric(arrow_type):
+    '''
+    Numeric columns are the ones pandas' describe() reports statistics for
+    '''
+    return pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)
+
+def pandas_dtype_name(arrow_type):
+    '''
+    Name of the dtype pandas' read_csv gives a column of the given arrow type; pandas reads any
+    non-numeric column as object
+    '''
+    if is_numeric(arrow_type) or pa.types.is_boolean(arrow_type):
+        return np.dtype(arrow_type.to_pandas_dtype()).name
+    return 'object'
+
+def row_keys(batch):
+    '''
+    Serializes every row of a record batch to bytes that only two equal rows share. Numeric values
+    are laid out in fixed width with a validity byte, straight from arrow; any other values are
+    appended as the repr of their tuple
+    '''
+    numeric_parts = []
+    other_columns = []
+    for column in batch.columns:
+        if is_numeric(column.type):
+            values = column.fill_null(0).to_numpy()
+            if values.dtype.kind == 'f':
+                # -0.0 equals 0.0, as it does for pandas
+                values = values + 0.0
+            numeric_parts.append(values.view(np.uint8).reshape(len(values), values.itemsize))
+            numeric_parts.append(column.is_valid().to_numpy(zero_copy_only=False).view(np.uint8).reshape(-1, 1))
+        else:
+            other_columns.append(column.to_pylist())
+
+    if numeric_parts:
+        matrix = np.hstack(numeric_parts)
+        width = matrix.shape[1]
+        buffer = memoryview(matrix.tobytes())
+        numeric_keys = (buffer[start:start + width] for start in range(0, width * batch.num_rows, width))
+    else:
+        numeric_keys = (b'' for _ in range(batch.num_rows))
+
+    if not other_columns:
+        return numeric_keys
+    return (bytes(key) + repr(values).encode() for key, values in zip(numeric_keys, zip(*other_columns)))
+
+def describe_column(column):
+    '''
+    Computes the describe() statistics (count, mean, std, min, quartiles, max), the number of
+    unique values and the number of missing values of a numeric column, all from a single sorted
+    copy of its values
+    '''
+    # Nulls come out of arrow as NaN, so one isnan mask both counts the missing values and drops them
+    values = column.to_numpy()
+    missing = np.isnan(values)
+    num_missing = int(np.count_nonzero(missing))
+    if num_missing:
+        values = values[~missing]
+    values = np.sort(values)
+    count = values.size
+
+    # Linear interpolation between the closest ranks, as pandas' quantile does
+    quartiles = []
+    for q in (0.25, 0.5, 0.75):
+        position = q * (count - 1)
+        lower = int(position)
+        upper = min(lower + 1, count - 1)
+        quartiles.append(float(values[lower] + (values[upper] - values[lower]) * (position - lower)))
+
+    stats = {
+        'count': float(count),
+        'mean': float(values.mean()),
+        'std': float(values.std(ddof=1)),
+        'min': float(values[0]),
+        '25%': quartiles[0],
+        '50%': quartiles[1],
+        '75%': quartiles[2],
+        'max': float(values[-1])
+    }
+    num_unique = int(np.count_nonzero(np.diff(values))) + 1
+    return stats, num_unique, num_missing
+
+def scan_csv(reader, max_duplicate_rows):
+    '''
+    Streams the record batches of a CSV reader, keeping only the numeric columns (in arrow's
+    columnar format, since exact quartiles need every value), the running missing and unique
+    values of the other columns and a digest of every row
+    '''
+    schema = reader.schema
+    num_rows = 0
+    missing_values = {name: 0 for name in schema.names}
+    numeric_chunks = {field.name: [] for field in schema if is_numeric(field.type)}
+    # Columns empty in every row of the first block are typed null by arrow and have no
+    # distinct values, only missing ones
+    null_columns = {field.name for field in schema if pa.types.is_null(field.type)}
+    distinct_values = {field.name: pa.array([], type=field.type) for field in schema
+                       if field.name not in numeric_chunks and field.name not in null_columns}
+    row_digests = []
+
+    for batch in reader:
+        num_rows += batch.num_rows
+        for name, column in zip(schema.names, batch.columns):
+            if name in numeric_chunks:
+                numeric_chunks[name].append(column)
+            elif name in null_columns:
+                missing_values[name] += batch.num_rows
+            else:
+                missing_values[name] += column.null_count
+                # Merge the batch into the column's running unique values without leaving arrow
+                distinct_values[name] = pc.unique(pa.chunked_array([distinct_values[name], column]))
+
+        # A digest of each row takes the same 16 bytes whatever the width of the row
+        if row_digests is not None and num_rows > max_duplicate_rows:
+            row_digests = None
+        elif row_digests is not None:
+            row_digests.append(np.fromiter(
+                (blake2b(key, digest_size=ROW_DIGEST_SIZE).digest() for key in row_keys(batch)),
+                dtype=f'S{ROW_DIGEST_SIZE}', count=batch.num_rows))
+
+    return num_rows, missing_values, numeric_chunks, null_columns, distinct_values, row_digests
 
 def lambda_handler(event,context):
     # Extract bucket name and file key from S3 path
-    
+
     file_path = event.get('file_path')
     bucket_name = file_path.split('/')[2]  # Extracting bucket name from s3 path
     file_key = '/'.join(file_path.split('/')[3:])  # Extracting file key from s3 path
+    max_duplicate_rows = event.get('max_duplicate_rows', MAX_DUPLICATE_ROWS)
+
+    # Arrow fixes the type of every column from the first block of the file. When later rows don't
+    # fit (e.g. a decimal after whole numbers), the file is streamed again with its integer and empty
+    # columns widened to float64, and as a last resort parsed as a single block, so that the types
+    # are inferred from every row as pandas does
+    widened_types = {}
+    block_size = CSV_BLOCK_SIZE
+    while True:
+        # A single GET returns both the last modified date and the streaming body of the dataset
+        response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+        reader = None
+        try:
+            with response['Body'] as stream:
+                # Empty strings count as missing, as they do for pandas
+                reader = pac.open_csv(
+                    stream,
+                    read_options=pac.ReadOptions(block_size=block_size),
+                    convert_options=pac.ConvertOptions(
+                        column_types={name: pa.float64() for name in widened_types},
+                        strings_can_be_null=True)
+                )
+                num_rows, missing_values, numeric_chunks, null_columns, distinct_values, row_digests = \
+                    scan_csv(reader, max_duplicate_rows)
+            break
+        except pa.ArrowInvalid as e:
+            # Errors that a single block also hits (e.g. a row with extra fields) are the file's own
+            if reader is None or block_size > response['ContentLength']:
+                raise
+            if not widened_types:
+                # First retry: stream again with the integer and empty columns widened
+                widened_types = {field.name: field.type for field in reader.schema
+                                 if pa.types.is_integer(field.type) or pa.types.is_null(field.type)}
+            else:
+                widened_types = {}
+            if not widened_types:
+                # Last retry, or nothing to widen: parse the whole file as one block
+                block_size = response['ContentLength'] + 1
+            logger.warning(f"Column types inferred from the first block don't fit every row ({e}), reading the file again")
 
-    df = pd.read_csv(file_path)
-    
-    s3 = boto3.client('s3')  # Uses configured credentials
-    
-    # Get object metadata to fetch last modified date
-    response = s3.head_object(Bucket=bucket_name, Key=file_key)
+    schema = reader.schema
     last_modified = response['LastModified'].strftime("%Y-%m-%d %H:%M:%S")
-    
+    schema_types = {field.name: pandas_dtype_name(field.type) for field in schema}
+
+    # Widened columns that stayed empty are empty columns again, and integer columns keep their
+    # type whenever all their values are whole numbers
+    for name, inferred_type in widened_types.items():
+        column = pa.chunked_array(numeric_chunks[name], type=pa.float64())
+        if column.null_count == len(column):
+            del numeric_chunks[name]
+            null_columns.add(name)
+            missing_values[name] = num_rows
+        elif pa.types.is_integer(inferred_type) and pc.all(pc.equal(pc.floor(column), column)).as_py():
+            schema_types[name] = pandas_dtype_name(inferred_type)
+    # pandas reads columns empty in every row as float64, or as object if the file has no rows
+    for name in null_columns:
+        schema_types[name] = 'float64' if num_rows else 'object'
+
     # Basic Metadata
     metadata = {}
     metadata['dataset_name'] = file_key.split('/')[-1]
     metadata['dataset_source'] = file_path
     metadata['creation_date'] = last_modified
-    
+
     # Structural Metadata
     if 'Structural_Metadata' not in metadata:
         metadata['Structural_Metadata'] = {}
-        
-    metadata['Structural_Metadata']['schema'] = df.dtypes.apply(lambda x: x.name).to_dict()
-    metadata['Structural_Metadata']['num_columns'] = df.shape[1]
-    metadata['Structural_Metadata']['num_rows'] = df.shape[0]
+
+    metadata['Structural_Metadata']['schema'] = schema_types
+    metadata['Structural_Metadata']['num_columns'] = len(schema.names)
+    metadata['Structural_Metadata']['num_rows'] = num_rows
     metadata['Structural_Metadata']['file_format'] = 'CSV'
-    
-    # Statistical Metadata
-    basic_stats = df.describe().to_dict()
+
+    # Statistical Metadata. Numeric columns get their unique and missing counts from the same pass.
+    # Columns empty in every row are float64 for pandas, so they get a count of 0 and NaN statistics.
+    basic_stats = {}
+    unique_values = {}
+    for name in schema.names:
+        if name in numeric_chunks:
+            column = pa.chunked_array(numeric_chunks[name], type=schema.field(name).type)
+            basic_stats[name], unique_values[name], missing_values[name] = describe_column(column)
+            # pandas' integer columns can't hold missing values, so it reads those columns as float64
+            if missing_values[name] and pa.types.is_integer(column.type):
+                schema_types[name] = 'float64'
+        elif name in null_columns and num_rows:
+            basic_stats[name] = dict.fromkeys(DESCRIBE_STATISTICS, float('nan'))
+            basic_stats[name]['count'] = 0.0
     metadata['basic_statistics'] = basic_stats
-    
+
     # Missing Values
-    missing_values = df.isnull().sum().to_dict()
     metadata['missing_values'] = missing_values
-    
+
     # Unique Values
-    unique_values = df.nunique().to_dict()
-    metadata['unique_values'] = unique_values
-    
+    for name, values in distinct_values.items():
+        unique_values[name] = pc.count_distinct(values).as_py()
+    for name in null_columns:
+        unique_values[name] = 0
+    metadata['unique_values'] = {name: unique_values[name] for name in schema.names}
+
     # Data Quality
-    metadata['duplicates'] = df.duplicated().sum()
-    
+    if row_digests is None:
+        duplicates = None
+    else:
+        digests = np.concatenate(row_digests) if row_digests else np.array([], dtype=f'S{ROW_DIGEST_SIZE}')
+        row_digests = None
+        duplicates = num_rows - np.unique(digests).size
+    metadata['duplicates'] = duplicates
+
     # Technical Metadata
     metadata['storage_location'] = file_path
-    
+
     return metadata
\ No newline at end of file
@@ -1,31 +1,17 @@
-import json
-import boto3
-import logging
 from typing import Dict, Any
-import datetime 
-import os
+from concurrent.futures import ThreadPoolExecutor
+from common.s3_helpers import get_config_data, get_last_modified_key
+from common.dates import madrid_timestamp
+from common.clients import create_client
+from common.logs import get_logger
 
-# Initialize logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger(__name__)
 
-def get_config_data(s3_client, bucket: str, key: str) -> Dict[str, Any]:
-    '''
-    This function downloads a file from the specified S3 bucket and key and then parses 
-    it into a Python dictionary.
-    
-    Retreives batch config file
-    '''
-    try:
-        config_object = s3_client.get_object(Bucket=bucket, Key=key)
-        config_data = json.loads(config_object['Body'].read().decode('utf-8'))
-        return config_data
-    except s3_client.exceptions.NoSuchKey:
-        logger.error(f"Configuration file not found: {key}")
-        raise
-    except Exception as e:
-        logger.error(f"Error fetching or parsing the configuration file from S3: {e}")
-        raise
+s3_client = create_client('s3')
+sagemaker_client = create_client('sagemaker')
+
+# Worker used to overlap independent, I/O-bound API calls within an invocation
+executor = ThreadPoolExecutor(max_workers=2)
 
 def get_last_modified(prefix, bucket, s3_client):
     '''
@@ -34,11 +20,7 @@ def get_last_modified(prefix, bucket, s3_client):
     Retreives last batch df with no target for the batch job
     '''
     try:
-        response = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-        contents = response['Contents']
-        contents_sorted = sorted(contents, key=lambda obj: obj['LastModified'])
-        last_object_key = contents_sorted[-1]['Key']
-        return last_object_key
+        return get_last_modified_key(s3_client, bucket, prefix)
     except s3_client.exceptions.NoSuchKey:
         logger.error(f"Processing metadata file not found with prefix: {prefix}")
         raise
@@ -63,21 +45,44 @@ def create_batch_job(sagemaker_client, batch_job_args: Dict[str, Any]) -> Dict[s
         logger.error(f"Error creating batch job: {e}")
         raise
 
+def get_approved_model_package(sagemaker_client, model_package_group_name: str) -> Dict[str, Any]:
+    '''
+    Returns the ARN, model data url and version of the newest 'Approved' model package of a Model
+    Package Group, or None if there isn't any. It is looked up on every invocation, since the
+    training pipeline approves a new package and rejects the previous one at the end of each run.
+    '''
+    approved_package = sagemaker_client.list_model_packages(
+                        ModelPackageGroupName=model_package_group_name,
+                        ModelApprovalStatus='Approved',
+                        SortBy='CreationTime',
+                        SortOrder='Descending',
+                        MaxResults=1)
+    if not approved_package['ModelPackageSummaryList']:
+        return None
+
+    # The summary already carries the ARN and version; only the model data url needs a describe
+    approved_summary = approved_package['ModelPackageSummaryList'][0]
+    approved_model_desc = sagemaker_client.describe_model_package(ModelPackageName=approved_summary['ModelPackageArn'])
+    return {
+        'ModelPackageArn': approved_summary['ModelPackageArn'],
+        'ModelPackageVersion': approved_summary['ModelPackageVersion'],
+        'ModelDataUrl': approved_model_desc['InferenceSpecification']['Containers'][0]['ModelDataUrl']
+    }
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    s3_client = boto3.client('s3')
-    sagemaker_client = boto3.client('sagemaker')
     
-     # Set datetime
-    offset = datetime.timedelta(hours=2)
-    utc_now = datetime.datetime.utcnow()
-    madrid_now = utc_now + offset
-    date = madrid_now.strftime('%m-%d-%H%M%S')
+    # Set datetime
+    date = madrid_timestamp()
     
     source_bucket = event.get('source_bucket', 'qloudy-xgboost-demo')
     model_package_group_name = event.get('model_package_group_name')
     batch_config_key = event.get('batch_config_key')
     debug_ = event.get('debug_', False)
     
+    # Get the 'Approved' or production model from the Model Package Group. The lookup only
+    # depends on the event, so it runs while the config file and the last batch df are read.
+    approved_model_future = executor.submit(get_approved_model_package, sagemaker_client, model_package_group_name)
+    
     try:
         config_data = get_config_data(s3_client, source_bucket, batch_config_key)
         instancetype = config_data['InstanceType']
@@ -105,22 +110,18 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': 'Error fetching or parsing the configuration file from S3.'
         }
     
-    # Get the 'Approved' or production model from the Model Package Group
-    approved_package = sagemaker_client.list_model_packages(
-                        ModelPackageGroupName=model_package_group_name,
-                        ModelApprovalStatus='Approved')
+    approved_model = approved_model_future.result()
 
-    if not approved_package['ModelPackageSummaryList']:
+    if not approved_model:
         logger.error('No approved model packages found.')
         return  {
             'statusCode': 500,
             'body': 'Error: no approved model packages found.'
         }
     
-    approved_arn = approved_package['ModelPackageSummaryList'][0]['ModelPackageArn']
-    approved_model_desc = sagemaker_client.describe_model_package(ModelPackageName=approved_arn)
-    approved_model_url = approved_model_desc['InferenceSpecification']['Containers'][0]['ModelDataUrl']
-    approved_model_package_version = approved_model_desc['ModelPackageVersion']
+    approved_arn = approved_model['ModelPackageArn']
+    approved_model_url = approved_model['ModelDataUrl']
+    approved_model_package_version = approved_model['ModelPackageVersion']
 
     logger.info(f'Approved model package: {approved_arn}, version {approved_model_package_version}')
 
@@ -193,6 +194,12 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'ApprovedModelPackageArn':approved_arn,
         'ApprovedModelPackageUrl':approved_model_url,
         'ModelName':model_name,
+        'ModelMetadata':{
+            'ModelName': model_name,
+            'Image': model_image,
+            'ModelDataUrl': approved_model_url,
+            'ModelArn': model_arn
+        },
         'source_bucket':source_bucket
     }
     
@@ -1,57 +1,54 @@
 import json
-import boto3
-import logging
 from typing import Dict, Any
-import datetime 
-import os
+from common.s3_helpers import get_config_data, get_latest_metadata
+from common.dates import madrid_timestamp
+from common.clients import create_client
+from common.logs import get_logger
 
-# Initialize logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger(__name__)
 
-def get_config_data(s3_client, bucket: str, key: str) -> Dict[str, Any]:
-    '''
-    This function downloads a file from the specified S3 bucket and key and then parses 
-    it into a Python dictionary.
-    
-    Retreives HPO config file
-    '''
-    try:
-        config_object = s3_client.get_object(Bucket=bucket, Key=key)
-        config_data = json.loads(config_object['Body'].read().decode('utf-8'))
-        return config_data
-    except s3_client.exceptions.NoSuchKey:
-        logger.error(f"Configuration file not found: {key}")
-        raise
-    except Exception as e:
-        logger.error(f"Error fetching or parsing the configuration file from S3: {e}")
-        raise
+s3_client = create_client('s3')
+sagemaker_client = create_client('sagemaker')
+
+# Metric definitions scraped by SageMaker from the XGBoost training logs. Built once at import
+# time and shared by every invocation.
+METRIC_REGEX = '.*\\[[0-9]+\\].*#011{}:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'
+METRIC_NAMES = (
+    'train:mae',
+    'validation:aucpr',
+    'validation:f1_binary',
+    'validation:mae',
+    'validation:logloss',
+    'validation:f1',
+    'train:accuracy',
+    'validation:recall',
+    'validation:precision',
+    'train:error',
+    'validation:auc',
+    'train:auc',
+    'validation:error',
+    'train:rmse',
+    'train:logloss',
+    'validation:accuracy',
+)
+METRIC_DEFINITIONS = tuple(
+    {'Name': name, 'Regex': METRIC_REGEX.format(name.replace(':', '-'))} for name in METRIC_NAMES
+)
 
-def get_processing_metadata(s3_client, bucket: str, prefix: str) -> Dict[str, Any]:
+def stringify_range(range_dict: Dict[str, Any]) -> Dict[str, str]:
     '''
-    This function lists the objects in an S3 bucket with a given prefix, identifies the most recent
-    file, and then downloads and parses it into a Python dictionary. 
-    
-    Retrieves the last datasets for the HPO 
+    Converts an integer or continuous parameter range from the HPO config file into the string
+    based definition expected by the tuning job
     '''
-    try:
-        response = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-        processing_source_config_key = response['Contents'][-1]['Key']
-        processing_metadata_object = s3_client.get_object(Bucket=bucket, Key=processing_source_config_key)
-        processing_metadata_json = json.loads(processing_metadata_object['Body'].read().decode('utf-8'))
-        return processing_metadata_json
-    except s3_client.exceptions.NoSuchKey:
-        logger.error(f"Processing metadata file not found with prefix: {prefix}")
-        raise
-    except Exception as e:
-        logger.error(f"Error fetching processing metadata from S3: {e}")
-        raise
+    return {
+        "Name": range_dict.get("Name"),
+        "MinValue": str(range_dict.get("MinValue")),
+        "MaxValue": str(range_dict.get("MaxValue")),
+        "ScalingType": str(range_dict.get("ScalingType"))
+    }
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
-    s3_client = boto3.client('s3')
-    sagemaker_client = boto3.client('sagemaker')
-    
     source_bucket = event.get('source_bucket')
     source_config_key = event.get('source_config_key')
     objective_input = event.get('objective_input')
@@ -67,10 +64,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
     # Set datetime
-    offset = datetime.timedelta(hours=2)
-    utc_now = datetime.datetime.utcnow()
-    madrid_now = utc_now + offset
-    date = madrid_now.strftime('%m-%d-%H%M%S')
+    date = madrid_timestamp()
     
     
     # Tuning job config. It follows the hpo_config_file.json created in the Jupyter Notebook
@@ -95,32 +89,18 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         Objective['MetricName'] = objective['MetricName']
         logger.info(f'Using input objective specified in the event: {objective}')
 
+    # Integer and continuous ranges are passed to SageMaker with their values as strings
     ParamRanges = {
         "CategoricalParameterRanges": [],
-        "IntegerParameterRanges": [],
-        "ContinuousParameterRanges": []
+        "IntegerParameterRanges": [
+            stringify_range(range_dict)
+            for range_dict in config_data['ParameterRanges'].get('IntegerParameterRanges', [])
+        ],
+        "ContinuousParameterRanges": [
+            stringify_range(range_dict)
+            for range_dict in config_data['ParameterRanges'].get('ContinuousParameterRanges', [])
+        ]
     }
-    
-    
-    # Convert integer ranges to strings
-    integer_ranges = config_data['ParameterRanges'].get('IntegerParameterRanges', [])
-    for range_dict in integer_ranges:
-        ParamRanges["IntegerParameterRanges"].append({
-            "Name": range_dict.get("Name"),
-            "MinValue": str(range_dict.get("MinValue")),
-            "MaxValue": str(range_dict.get("MaxValue")),
-            "ScalingType":str(range_dict.get("ScalingType"))
-        })
-
-    # Convert continuous ranges to strings
-    continuous_ranges = config_data['ParameterRanges'].get('ContinuousParameterRanges', [])
-    for range_dict in continuous_ranges:
-        ParamRanges["ContinuousParameterRanges"].append({
-            "Name": range_dict.get("Name"),
-            "MinValue": str(range_dict.get("MinValue")),
-            "MaxValue": str(range_dict.get("MaxValue")),
-            "ScalingType":str(range_dict.get("ScalingType"))
-        })
 
     tuning_job_config={
         "Strategy":Strategy,
@@ -132,7 +112,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     processing_metadata_prefix = 'wine-quality-project/pipeline-metadata/processing-job-metadata'
     try:
         # Retreive the last df created 
-        processing_metadata_json = get_processing_metadata(s3_client, source_bucket, processing_metadata_prefix)
+        processing_metadata_json, _ = get_latest_metadata(s3_client, source_bucket, processing_metadata_prefix)
         last_hpo_train_df_path = processing_metadata_json['DatasetProperties']['hpo_train_uri']
         last_hpo_test_df_path = processing_metadata_json['DatasetProperties']['hpo_test_uri']
     except Exception as e:
@@ -151,39 +131,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         "AlgorithmSpecification": {
           "TrainingImage": TrainingImage,
           "TrainingInputMode": "File",
-          "MetricDefinitions": [
-               {'Name': 'train:mae',
-                'Regex': '.*\\[[0-9]+\\].*#011train-mae:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:aucpr',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-aucpr:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:f1_binary',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-f1_binary:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:mae',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-mae:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:logloss',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-logloss:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:f1',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-f1:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'train:accuracy',
-                'Regex': '.*\\[[0-9]+\\].*#011train-accuracy:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:recall',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-recall:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:precision',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-precision:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'train:error',
-                'Regex': '.*\\[[0-9]+\\].*#011train-error:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:auc',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-auc:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'train:auc',
-                'Regex': '.*\\[[0-9]+\\].*#011train-auc:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:error',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-error:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'train:rmse',
-                'Regex': '.*\\[[0-9]+\\].*#011train-rmse:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'train:logloss',
-                'Regex': '.*\\[[0-9]+\\].*#011train-logloss:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'},
-               {'Name': 'validation:accuracy',
-                'Regex': '.*\\[[0-9]+\\].*#011validation-accuracy:([-+]?[0-9]*\\.?[0-9]+(?:[eE][-+]?[0-9]+)?).*'}]
+          "MetricDefinitions": METRIC_DEFINITIONS
         },
         "InputDataConfig": [
           {
@@ -1,18 +1,39 @@
 import json
-import boto3
-import logging
 from typing import Dict, Any
-import datetime
+from common.s3_helpers import get_config_data
+from common.dates import madrid_timestamp
+from common.clients import create_client, BURST_CLIENT_OPTIONS, warm_operation_models
+from common.logs import get_logger
 
 
-# Initialize logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger(__name__)
+
+s3_client = create_client('s3', **BURST_CLIENT_OPTIONS)
+sagemaker_client = create_client('sagemaker', **BURST_CLIENT_OPTIONS)
+
+warm_operation_models(s3_client, 'GetObject')
+warm_operation_models(sagemaker_client, 'CreateProcessingJob')
+
+# Constant parts of the processing job definition, built once per execution environment. Each
+# invocation only splices in the job name and the values read from the config file.
+PROCESSING_INPUTS = (
+    ('requirements-input', '/opt/ml/processing/input/requirements'),
+    ('code-input', '/opt/ml/processing/input/code'),
+    ('data-input', '/opt/ml/processing/input/dataset')
+)
+PROCESSING_OUTPUTS = (
+    ('preprocessed_hpo_data', '/opt/ml/processing/output/hpo'),
+    ('preprocessed_training_data', '/opt/ml/processing/output/training'),
+    ('wine_quality_metadata', '/opt/ml/processing/output/wine_quality_df_metadata')
+)
+S3_INPUT_SETTINGS = {'S3DataType': 'S3Prefix', 'S3InputMode': 'File', 'S3DataDistributionType': 'FullyReplicated'}
+STOPPING_CONDITION = {'MaxRuntimeInSeconds': 3600}
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
-    s3_client = boto3.client('s3')
-    sagemaker_client = boto3.client('sagemaker')
+    # Scheduled warm-up pings only keep the execution environment initialized
+    if event.get('warmup'):
+        return {'warm': True}
 
     # Define the S3 bucket and config file key
     source_bucket = event.get('source_bucket', 'qloudy-xgboost-demo')
@@ -21,8 +42,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
     # Fetch the processing config file from S3
     try:
-        config_object = s3_client.get_object(Bucket=source_bucket, Key=source_config_key)
-        config_data = json.loads(config_object['Body'].read().decode('utf-8'))
+        config_data = get_config_data(s3_client, source_bucket, source_config_key)
     except Exception as e:
         logger.error(f"Error fetching or parsing the configuration file from S3: {e}")
         return {
@@ -51,72 +71,27 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
     # Generate a dynamic processor job name
-    offset = datetime.timedelta(hours=2)
-    utc_now = datetime.datetime.utcnow()
-    madrid_now = utc_now + offset
-    date = madrid_now.strftime('%m-%d-%H%M%S')
+    date = madrid_timestamp()
     processor_job_name = "wine-quality-processor-" + date
 
     # Define processing job arguments
     processing_args = {
         'ProcessingInputs': [
             {
-                'InputName': 'requirements-input',
-                'S3Input': {
-                    'S3Uri': requirements_uri,
-                    'LocalPath': '/opt/ml/processing/input/requirements',
-                    'S3DataType': 'S3Prefix',
-                    'S3InputMode': 'File',
-                    'S3DataDistributionType': 'FullyReplicated'
-                }
-            },
-            {
-                'InputName': 'code-input',
-                'S3Input': {
-                    'S3Uri': processing_script_s3_uri,
-                    'LocalPath': '/opt/ml/processing/input/code',
-                    'S3DataType': 'S3Prefix',
-                    'S3InputMode': 'File',
-                    'S3DataDistributionType': 'FullyReplicated'
-                }
-            },
-            {
-                'InputName': 'data-input',
-                'S3Input': {
-                    'S3Uri': input_data_location,
-                    'LocalPath': '/opt/ml/processing/input/dataset',
-                    'S3DataType': 'S3Prefix',
-                    'S3InputMode': 'File',
-                    'S3DataDistributionType': 'FullyReplicated'
-                }
+                'InputName': input_name,
+                'S3Input': {'S3Uri': s3_uri, 'LocalPath': local_path} | S3_INPUT_SETTINGS
             }
+            for (input_name, local_path), s3_uri in zip(
+                PROCESSING_INPUTS, (requirements_uri, processing_script_s3_uri, input_data_location))
         ],
         'ProcessingOutputConfig': {
             'Outputs': [
                 {
-                    'OutputName': 'preprocessed_hpo_data',
-                    'S3Output': {
-                        'S3Uri': output_hpo_location,
-                        'LocalPath': '/opt/ml/processing/output/hpo',
-                        'S3UploadMode': 'EndOfJob'
-                    }
-                },
-                {
-                    'OutputName': 'preprocessed_training_data',
-                    'S3Output': {
-                        'S3Uri': output_training_location,
-                        'LocalPath': '/opt/ml/processing/output/training',
-                        'S3UploadMode': 'EndOfJob'
-                    }
-                },
-                {
-                    'OutputName': 'wine_quality_metadata',
-                    'S3Output': {
-                        'S3Uri': wine_quality_metadata_location,
-                        'LocalPath': '/opt/ml/processing/output/wine_quality_df_metadata',
-                        'S3UploadMode': 'EndOfJob'
-                    }
+                    'OutputName': output_name,
+                    'S3Output': {'S3Uri': s3_uri, 'LocalPath': local_path, 'S3UploadMode': 'EndOfJob'}
                 }
+                for (output_name, local_path), s3_uri in zip(
+                    PROCESSING_OUTPUTS, (output_hpo_location, output_training_location, wine_quality_metadata_location))
             ]
         },
         'ProcessingResources': {
@@ -132,9 +107,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         },
         'RoleArn': role,
         'ProcessingJobName': processor_job_name,
-        'StoppingCondition': {
-            'MaxRuntimeInSeconds': 3600
-        }
+        'StoppingCondition': STOPPING_CONDITION
     }
 
     # Create the processing job if debug mode is disabled
@@ -1,54 +1,22 @@
-import json
-import boto3
-import logging
 from typing import Dict, Any
-import datetime 
-import os
+from common.s3_helpers import get_config_data, get_latest_metadata
+from common.dates import madrid_timestamp
+from common.clients import create_client, BURST_CLIENT_OPTIONS, warm_operation_models
+from common.logs import get_logger
 
-# Initialize logging
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger(__name__)
 
-def get_config_data(s3_client, bucket: str, key: str) -> Dict[str, Any]:
-    '''
-    This function downloads a file from the specified S3 bucket and key and then parses 
-    it into a Python dictionary.
+s3_client = create_client('s3', **BURST_CLIENT_OPTIONS)
+sagemaker_client = create_client('sagemaker', **BURST_CLIENT_OPTIONS)
 
-    Retreives training config file
-    '''
-    try:
-        config_object = s3_client.get_object(Bucket=bucket, Key=key)
-        config_data = json.loads(config_object['Body'].read().decode('utf-8'))
-        return config_data
-    except s3_client.exceptions.NoSuchKey:
-        logger.error(f"Configuration file not found: {key}")
-        raise
-    except Exception as e:
-        logger.error(f"Error fetching or parsing the configuration file from S3: {e}")
-        raise
+warm_operation_models(s3_client, 'GetObject', 'ListObjectsV2', paginators=('list_objects_v2',))
+warm_operation_models(sagemaker_client, 'CreateTrainingJob')
 
-def get_last_modified(prefix, bucket, s3_client) -> Dict[str, Any]:
-    '''
-    This function lists the objects in an S3 bucket with a given prefix, identifies the most recent
-    file, and then downloads and parses it into a Python dictionary. 
-    
-    Retrieves the last modified/added json 
-    '''
-    try:
-        response = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-        contents = response['Contents']
-        contents_sorted = sorted(contents, key=lambda obj: obj['LastModified'])
-        last_object_key = contents_sorted[-1]['Key']
-        metadata_object = s3_client.get_object(Bucket=bucket, Key=last_object_key)
-        metadata_json = json.loads(metadata_object['Body'].read().decode('utf-8'))
-        return metadata_json, last_object_key
-        
-    except s3_client.exceptions.NoSuchKey:
-        logger.error(f"Processing metadata file not found with prefix: {prefix}")
-        raise
-    except Exception as e:
-        logger.error(f"Error fetching processing metadata from S3: {e}")
-        raise
+# Constant parts of the training job definition, built once per execution environment. Each
+# invocation only splices in the job name, the hyperparameters and the values read from S3.
+S3_DATA_SOURCE_SETTINGS = {'S3DataType': 'S3Prefix', 'S3DataDistributionType': 'FullyReplicated'}
+CHANNEL_SETTINGS = {'ContentType': 'text/csv', 'CompressionType': 'None'}
+STOPPING_CONDITION = {'MaxRuntimeInSeconds': 3600, 'MaxWaitTimeInSeconds': 3600}
 
 def create_training_job(sagemaker_client, training_job_args: Dict[str, Any]) -> Dict[str, Any]:
     '''
@@ -69,8 +37,10 @@ def create_training_job(sagemaker_client, training_job_args: Dict[str, Any]) ->
         raise
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    s3_client = boto3.client('s3')
-    sagemaker_client = boto3.client('sagemaker')
+
+    # Scheduled warm-up pings only keep the execution environment initialized
+    if event.get('warmup'):
+        return {'warm': True}
 
     source_bucket = event.get('source_bucket')
     eval_metric = event.get('eval_metric', None)
@@ -94,7 +64,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         instancetype = config_data['InstanceType']
         training_job_output_path = config_data['S3OutputPath']
        
-        response = s3_client.list_objects_v2(Bucket=source_bucket, Prefix=best_hyp_config_prefix)
+        response = s3_client.list_objects_v2(Bucket=source_bucket, Prefix=best_hyp_config_prefix, MaxKeys=1)
         
         # First, try to find a hyp json from a previous HPO. If there isn't, then use default hyperparameters
         if not 'Contents' in response:
@@ -106,7 +76,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         else:
             # Get the last hyperparameters
             logger.info('There are hyperparameters metadata')
-            hyp_data, last_hyp_object_key = get_last_modified(best_hyp_config_prefix, source_bucket, s3_client)
+            hyp_data, last_hyp_object_key = get_latest_metadata(s3_client, source_bucket, best_hyp_config_prefix)
             hyperparameters = hyp_data['TrainingJobMetadata']['TunedHyperParameters']
             hyperparameters['objective'] = 'binary:logistic'
             hyperparameters['eval_metric'] = eval_metric
@@ -129,17 +99,14 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
     # Set datetime
-    offset = datetime.timedelta(hours=2)
-    utc_now = datetime.datetime.utcnow()
-    madrid_now = utc_now + offset
-    date = madrid_now.strftime('%m-%d-%H%M%S')
+    date = madrid_timestamp()
     training_job_name = "wine-quality-estimator-" + date
     
     processing_metadata_prefix = 'wine-quality-project/pipeline-metadata/processing-job-metadata'
     
     # Retreive the last df to launch the training job
     try:
-        processing_metadata_json, last_processing_key = get_last_modified(processing_metadata_prefix, source_bucket, s3_client)
+        processing_metadata_json, last_processing_key = get_latest_metadata(s3_client, source_bucket, processing_metadata_prefix)
         last_train_df_path = processing_metadata_json['DatasetProperties']['train_uri']
         last_test_df_path = processing_metadata_json['DatasetProperties']['test_uri']
         
@@ -165,36 +132,16 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'RoleArn': role,
         'InputDataConfig': [
             {
-                'ChannelName': 'train',
-                'DataSource': {
-                    'S3DataSource': {
-                        'S3DataType': 'S3Prefix',
-                        'S3Uri': last_train_df_path,
-                        'S3DataDistributionType': 'FullyReplicated',
-                    }
-                },
-                'ContentType': 'text/csv',
-                'CompressionType': 'None'
-            },
-            {
-                'ChannelName': 'validation',
-                'DataSource': {
-                    'S3DataSource': {
-                        'S3DataType': 'S3Prefix',
-                        'S3Uri': last_test_df_path,
-                        'S3DataDistributionType': 'FullyReplicated',
-                    }
-                },
-                'ContentType': 'text/csv',
-                'CompressionType': 'None'
-            },
+                'ChannelName': channel_name,
+                'DataSource': {'S3DataSource': {'S3Uri': s3_uri} | S3_DATA_SOURCE_SETTINGS}
+            } | CHANNEL_SETTINGS
+            for channel_name, s3_uri in (('train', last_train_df_path), ('validation', last_test_df_path))
         ],
         'OutputDataConfig': {'S3OutputPath': training_job_output_path},
         'ResourceConfig': {'InstanceType': instancetype, 
                            'InstanceCount': 1, 
                            'VolumeSizeInGB': 5},
-        'StoppingCondition': {'MaxRuntimeInSeconds': 3600,
-                              'MaxWaitTimeInSeconds': 3600},
+        'StoppingCondition': STOPPING_CONDITION,
         'EnableNetworkIsolation': False,
         'EnableManagedSpotTraining': True
     }
@@ -1,22 +1,23 @@
 import json
-import logging
-import boto3
 from botocore.exceptions import ClientError
-import datetime
+from common.dates import madrid_timestamp
+from common.s3_helpers import put_metadata
+from common.clients import create_client, warm_operation_models
+from common.logs import get_logger
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger(__name__)
 
-# Set datetime
-offset = datetime.timedelta(hours=2)
-utc_now = datetime.datetime.utcnow()
-madrid_now = utc_now + offset
-date = madrid_now.strftime('%m-%d-%H%M%S')
+s3_client = create_client('s3')
+sm_client = create_client('sagemaker')
+
+warm_operation_models(sm_client, 'DescribeTransformJob', 'DescribeModel')
+warm_operation_models(s3_client, 'PutObject')
 
 def lambda_handler(event, context):
     
-    s3_client = boto3.client('s3')
-    sm_client = boto3.client('sagemaker')
+    # Set datetime
+    date = madrid_timestamp()
+    
     source_bucket = event.get('source_bucket')
     
     batch_metadata_name = f'batch_metadata-{date}.json'
@@ -36,7 +37,18 @@ def lambda_handler(event, context):
     try:
         response_1 = sm_client.describe_transform_job(TransformJobName=batch_job_name)
         model_name = response_1['ModelName']
-        response_2 = sm_client.describe_model(ModelName=model_name)
+        
+        # launch-batch-job passes the model it created through the state machine; describe it
+        # only when the event doesn't carry it
+        model_metadata = event.get('ModelMetadata')
+        if not model_metadata:
+            response_2 = sm_client.describe_model(ModelName=model_name)
+            model_metadata = {
+                'ModelName': response_2['ModelName'],
+                'Image': response_2['PrimaryContainer']['Image'],
+                'ModelDataUrl': response_2['PrimaryContainer']['ModelDataUrl'],
+                'ModelArn': response_2['ModelArn']
+            }
 
         transform_start_time = response_1['TransformStartTime']
         transform_end_time = response_1['TransformEndTime']
@@ -50,21 +62,10 @@ def lambda_handler(event, context):
                 'TransformInputS3Uri': response_1['TransformInput']['DataSource']['S3DataSource']['S3Uri'],
                 'TransformOutput': response_1['TransformOutput']
             },
-            'ModelMetadata':{
-                'ModelName': response_2['ModelName'],
-                'Image': response_2['PrimaryContainer']['Image'],
-                'ModelDataUrl': response_2['PrimaryContainer']['ModelDataUrl'],
-                'ModelArn': response_2['ModelArn']
-            }
+            'ModelMetadata': model_metadata
         }
 
-        json_data = json.dumps(metadata, default=str, indent=2)
-
-        s3_client.put_object(
-            Bucket=source_bucket,
-            Key=s3_key,
-            Body=json_data.encode('utf-8')
-        )
+        put_metadata(s3_client, source_bucket, s3_key, metadata)
         logger.info(f"Successfully uploaded batch metadata to S3 bucket {source_bucket} with key {s3_key}.")
         return {
             'statusCode': 200,
@@ -1,34 +1,28 @@
 import json
-import logging
-import boto3
 from botocore.exceptions import ClientError
-import datetime
+from concurrent.futures import ThreadPoolExecutor
+from common.dates import madrid_timestamp
+from common.s3_helpers import get_last_modified_key, put_metadata
+from common.clients import create_client, warm_operation_models
+from common.logs import get_logger
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger(__name__)
 
-# Set datetime
-offset = datetime.timedelta(hours=2)
-utc_now = datetime.datetime.utcnow()
-madrid_now = utc_now + offset
-date = madrid_now.strftime('%m-%d-%H%M%S')
+s3_client = create_client('s3')
+sm_client = create_client('sagemaker')
 
+warm_operation_models(sm_client, 'DescribeProcessingJob')
+warm_operation_models(s3_client, 'ListObjectsV2', 'PutObject', paginators=('list_objects_v2',))
 
-def get_last_modified(df_prefix,source_bucket,s3_client):
-    '''
-    Retreive the last added/modified object in an S3Uri
-    '''
-    response = s3_client.list_objects_v2(Bucket=source_bucket, Prefix=df_prefix)
-    contents = response['Contents']
-    contents_sorted = sorted(contents, key=lambda obj: obj['LastModified'])
-    last_df_key = contents_sorted[-1]['Key']
-    last_df_S3uri = f"s3://{source_bucket}/{last_df_key}"
-    return last_df_S3uri
+# Workers used to run the SageMaker describe and the independent S3 listings of the preprocessed
+# dfs at the same time. The pool of the default client config (10 connections) is large enough for all of them.
+executor = ThreadPoolExecutor(max_workers=5)
 
 def lambda_handler(event, context):
     
-    s3_client = boto3.client('s3')
-    sm_client = boto3.client('sagemaker')
+    # Set datetime
+    date = madrid_timestamp()
+    
     source_bucket = event.get('source_bucket')
     s3_key = f'wine-quality-project/pipeline-metadata/processing-job-metadata/processing_metadata-{date}.json'
     processing_job_name = event["ProcessingJobName"]
@@ -41,26 +35,26 @@ def lambda_handler(event, context):
         }
 
     try:
-        response = sm_client.describe_processing_job(ProcessingJobName=processing_job_name)
-
+        # The job description doesn't depend on the dfs, so it is fetched while they are listed
+        describe_future = executor.submit(sm_client.describe_processing_job, ProcessingJobName=processing_job_name)
+        
+        # Get last training and HPO dfs. The four listings are independent, so they run in parallel.
+        df_prefixes = (
+            'wine-quality-project/preprocessed_data/training/train',
+            'wine-quality-project/preprocessed_data/training/test',
+            'wine-quality-project/preprocessed_data/hpo/train',
+            'wine-quality-project/preprocessed_data/hpo/test'
+        )
+        (last_train_df_S3Uri, last_test_df_S3Uri,
+         last_hpo_train_df_S3Uri, last_hpo_test_df_S3Uri) = executor.map(
+            lambda df_prefix: f's3://{source_bucket}/{get_last_modified_key(s3_client, source_bucket, df_prefix)}',
+            df_prefixes)
+        
+        response = describe_future.result()
         processing_start_time = response['ProcessingStartTime']
         processing_end_time = response['ProcessingEndTime']
         processing_duration = (processing_end_time - processing_start_time).total_seconds()
         
-        # Get last training dfs
-        last_train_df_prefix = 'wine-quality-project/preprocessed_data/training/train'
-        last_train_df_S3Uri = get_last_modified(last_train_df_prefix,source_bucket,s3_client)
-        
-        last_test_df_prefix = 'wine-quality-project/preprocessed_data/training/test'
-        last_test_df_S3Uri = get_last_modified(last_test_df_prefix,source_bucket,s3_client)
-        
-        # Get last HPO dfs
-        last_hpo_train_df_prefix = 'wine-quality-project/preprocessed_data/hpo/train'
-        last_hpo_train_df_S3Uri =  get_last_modified(last_hpo_train_df_prefix,source_bucket,s3_client)
-        
-        last_hpo_test_df_prefix = 'wine-quality-project/preprocessed_data/hpo/test'
-        last_hpo_test_df_S3Uri = get_last_modified(last_hpo_test_df_prefix,source_bucket,s3_client)
-        
         date_id = '-'.join(last_train_df_S3Uri.split('-')[-3:]).split('.')[0]
 
         processing_metadata = {
@@ -80,13 +74,7 @@ def lambda_handler(event, context):
             }
         }
 
-        json_data = json.dumps(processing_metadata, default=str, indent=2)
-
-        s3_client.put_object(
-            Bucket=source_bucket,
-            Key=s3_key,
-            Body=json_data.encode('utf-8')
-        )
+        put_metadata(s3_client, source_bucket, s3_key, processing_metadata, keep_latest=True)
         
         logger.info(f"Successfully uploaded processing metadata to S3 bucket '{source_bucket}' with key'{s3_key}'.")
         
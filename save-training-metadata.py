@@ -1,22 +1,23 @@
 import json
-import logging
-import boto3
 from botocore.exceptions import ClientError
-import datetime
+from common.dates import madrid_timestamp
+from common.s3_helpers import put_metadata
+from common.clients import create_client, warm_operation_models
+from common.logs import get_logger
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger(__name__)
 
-# Set datetime
-offset = datetime.timedelta(hours=2)
-utc_now = datetime.datetime.utcnow()
-madrid_now = utc_now + offset
-date = madrid_now.strftime('%m-%d-%H%M%S')
+s3_client = create_client('s3')
+sm_client = create_client('sagemaker')
+
+warm_operation_models(sm_client, 'DescribeTrainingJob')
+warm_operation_models(s3_client, 'PutObject')
 
 def lambda_handler(event, context):
     
-    s3_client = boto3.client('s3')
-    sm_client = boto3.client('sagemaker')
+    # Set datetime
+    date = madrid_timestamp()
+    
     source_bucket = event.get('source_bucket')
     eval_metric = event.get('eval_metric')
     model_package_group_name = event.get('model_package_group_name')
@@ -60,14 +61,8 @@ def lambda_handler(event, context):
             }
         }
 
-        json_data = json.dumps(training_metadata, default=str, indent=2)
-
         # Upload metadata file to S3 path
-        s3_client.put_object(
-            Bucket=source_bucket,
-            Key=s3_key,
-            Body=json_data.encode('utf-8')
-        )
+        put_metadata(s3_client, source_bucket, s3_key, training_metadata)
         logger.info(f"Successfully uploaded training metadata to S3 bucket {source_bucket} with key {s3_key}.")
         
         return {
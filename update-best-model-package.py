@@ -1,164 +1,208 @@
 import json
-import logging
-import boto3
 from botocore.exceptions import BotoCoreError,ClientError
-import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from common.clients import create_client
+from common.logs import get_logger
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger(__name__)
 
-# Set datetime
-offset = datetime.timedelta(hours=2)
-utc_now = datetime.datetime.utcnow()
-madrid_now = utc_now + offset
-date = madrid_now.strftime('%m-%d-%H%M%S')
+# Short connect/read timeouts let the adaptive retries recover from a stalled call quickly
+CLIENT_OPTIONS = {
+    'retries': {'mode': 'adaptive', 'max_attempts': 5},
+    'max_pool_connections': 16,
+    'connect_timeout': 2,
+    'read_timeout': 10
+}
+s3_client = create_client('s3', **CLIENT_OPTIONS)
+sagemaker_client = create_client('sagemaker', **CLIENT_OPTIONS)
 
-s3_client = boto3.client('s3')
-sagemaker_client = boto3.client('sagemaker')
+# Evaluation metrics where a higher value is better; any other metric is minimized
+MAXIMIZE_METRICS = frozenset({
+    'accuracy', 'auc', 'aucpr', 'f1', 'f1_binary', 'map', 'ndcg', 'precision', 'recall'
+})
+
+# Production package metrics per (package ARN, metric name). The production package is compared
+# on every run and its metrics never change, so warm invocations reuse them for a few minutes. The
+# package created by each run is looked up only once, so its metric is never cached.
+METRIC_TTL_SECONDS = 300
+metric_cache = {}
+
+# Bodies of the responses with a fixed message, serialized once per execution environment
+MULTIPLE_PRODUCTION_MODELS_BODY = json.dumps({'message': 'There are more than 1 models in production'})
+TIE_BODY = json.dumps({'message': 'New model ties with the production model, left pending manual approval'})
+PRODUCTION_BEST_BODY = json.dumps({'message': 'Production model remains the best'})
+NEW_BEST_BODY = json.dumps({'message': 'New model from last training job is the best now'})
+
+# Workers used to overlap independent SageMaker calls within an invocation
+executor = ThreadPoolExecutor(max_workers=2)
 
 def create_model_package(source_bucket,metadata_key, model_package_group_name, model_status='PendingManualApproval'):
     '''
         Function that creates a model package in a model package group from a metadata json containing metadata of a training job
     '''
-    try:
-        # Get last training job metadata JSON file from S3
-        response = s3_client.get_object(Bucket=source_bucket, Key=metadata_key)
-        training_metadata = response['Body'].read().decode('utf-8')
-        training_metadata = json.loads(training_metadata)
-        
-        metrics = training_metadata['ModelRegistry']['ModelMetrics']
-        image = training_metadata['TrainingJobMetadata']['TrainingImage']
-        model_data_url = training_metadata['ModelRegistry']['ModelDataUrl']
-        training_job_date = training_metadata['TrainingJobMetadata']['TrainingEndTime']
-        model_status='PendingManualApproval'
+    # Get last training job metadata JSON file from S3
+    response = s3_client.get_object(Bucket=source_bucket, Key=metadata_key)
+    with response['Body'] as body:
+        training_metadata = json.load(body)
+    
+    metrics = training_metadata['ModelRegistry']['ModelMetrics']
+    image = training_metadata['TrainingJobMetadata']['TrainingImage']
+    model_data_url = training_metadata['ModelRegistry']['ModelDataUrl']
+    training_job_date = training_metadata['TrainingJobMetadata']['TrainingEndTime']
+    model_status='PendingManualApproval'
 
-        # Prepare the package creation arguments
-        package_args = {
-            'ModelPackageGroupName': model_package_group_name,
-            'ModelPackageDescription': '.',
-            'InferenceSpecification': {
-                'Containers': [
-                    {
-                        'Image': image,
-                        'ModelDataUrl': model_data_url
-                    }
-                ],
-                'SupportedContentTypes': ['text/csv'],
-                'SupportedResponseMIMETypes': ['text/csv'],
-            },
-            'ModelApprovalStatus': model_status,
-            'CustomerMetadataProperties': {
-                'TrainingJobDate': training_job_date,
-                'Model_version': '.'
-            }
+    # Prepare the package creation arguments
+    package_args = {
+        'ModelPackageGroupName': model_package_group_name,
+        'ModelPackageDescription': '.',
+        'InferenceSpecification': {
+            'Containers': [
+                {
+                    'Image': image,
+                    'ModelDataUrl': model_data_url
+                }
+            ],
+            'SupportedContentTypes': ['text/csv'],
+            'SupportedResponseMIMETypes': ['text/csv'],
+        },
+        'ModelApprovalStatus': model_status,
+        'CustomerMetadataProperties': {
+            'TrainingJobDate': training_job_date,
+            'Model_version': '.',
+            **{str(metric['MetricName']): str(metric['Value']) for metric in metrics}
         }
+    }
 
-        for metric in metrics:
-            name = metric['MetricName']
-            value = metric['Value']
-            package_args['CustomerMetadataProperties'][str(name)] = str(value)
+    # Create the new model package. Its 'Model_version' is set by the approval update that
+    # follows the comparison, since the version is only known once the package exists.
+    response = sagemaker_client.create_model_package(**package_args)
+    model_package_arn = response['ModelPackageArn']
+    
+    return model_package_arn
 
-        # Create the new model package
-        response = sagemaker_client.create_model_package(**package_args)
-        model_package_arn = response['ModelPackageArn']
-        
-        # Get model version
-        response = sagemaker_client.describe_model_package(ModelPackageName=model_package_arn)
-        model_version = response['ModelPackageVersion']
-        
-        # Update the model package with the correct model version
-        sagemaker_client.update_model_package(
-            ModelPackageArn=model_package_arn,
-            CustomerMetadataProperties={
-                'Model_version': f'1.0.{model_version}'
-            }
-        )
-        
-        return model_package_arn
+def get_model_version_properties(model_package_arn):
+    '''
+    Returns the 'Model_version' property of a model package. The version is the last part of the
+    package ARN (arn:aws:sagemaker:<region>:<account>:model-package/<group>/<version>)
+    '''
+    model_version = model_package_arn.rsplit('/', 1)[-1]
+    return {'Model_version': f'1.0.{model_version}'}
 
-    except (BotoCoreError, ClientError) as error:
-        logger.error(f"An error occurred in the create_model_package function: {error}")
-        raise
-    except KeyError as e:
-        logger.error(f"Key error: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"Exception error: {e}")
-        raise
+def get_model_metric(model_package_arn, metric_name, cache=False):
+    '''
+    Returns a metric of a model package. With 'cache', the metric is read from and stored in
+    metric_cache, and the expired entries are dropped when a new one is stored
+    '''
+    now = time.monotonic()
+    if cache:
+        cached = metric_cache.get((model_package_arn, metric_name))
+        if cached and now - cached[0] < METRIC_TTL_SECONDS:
+            return cached[1]
+    response = sagemaker_client.describe_model_package(ModelPackageName=model_package_arn)
+    metric = response['CustomerMetadataProperties'][metric_name]
+    if cache:
+        for key in [key for key, (stored_at, _) in metric_cache.items() if now - stored_at >= METRIC_TTL_SECONDS]:
+            del metric_cache[key]
+        metric_cache[(model_package_arn, metric_name)] = (now, metric)
+    return metric
 
-def get_model_metric(model_package_arn, metric_name):
+def lambda_handler(event, context):
+    '''
+    Runs the comparison and logs a single summary line of its outcome, whichever way it returns
+    '''
+    state = {}
     try:
-        response = sagemaker_client.describe_model_package(ModelPackageName=model_package_arn)
-        return response['CustomerMetadataProperties'][metric_name]
-    except (KeyError, BotoCoreError, ClientError) as error:
-        logger.error(f"An error occurred while retrieving the metric: {error}")
-        raise
+        return update_best_model_package(event, state)
+    finally:
+        logger.info(json.dumps(state))
 
-def lambda_handler(event, context):
+def update_best_model_package(event, state):
+    '''
+    Registers the model of the last training job and approves whichever of it and the production
+    model scores better. Each step records what it found in 'state'
+    '''
     
     source_bucket = event.get('source_bucket')
     training_metadata_name = event.get('TrainingMetadataJson', None)
     eval_metric = event.get('eval_metric', None)
     model_package_group_name = event.get('model_package_group_name')
+    
+    # Fail before any SageMaker call if the event is incomplete
+    missing_fields = [field for field, value in (
+        ('source_bucket', source_bucket),
+        ('TrainingMetadataJson', training_metadata_name),
+        ('eval_metric', eval_metric),
+        ('model_package_group_name', model_package_group_name)) if not value]
+    if missing_fields:
+        logger.error(f"Missing required fields in the event payload: {missing_fields}")
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'message': f'Missing required fields in the event payload: {missing_fields}'})
+        }
+    
     metric_name = f'validation:{eval_metric}'
+    state['model_package_group_name'] = model_package_group_name
+    state['metric_name'] = metric_name
     metadata_key = f'wine-quality-project/pipeline-metadata/training-job-metadata/{training_metadata_name}'
     
     try:
-        response = sagemaker_client.list_model_package_groups()
-        model_package_group_names = [group['ModelPackageGroupName'] for group in response['ModelPackageGroupSummaryList']]
-    
-        if model_package_group_name in model_package_group_names:
-            # Model Package Group already exists
-            logger.info(f"Model Package Group '{model_package_group_name}' already exists.")
-        else:
-            # Create the Model Package Group
-            logger.info(f"Creating Model Package Group with name: '{model_package_group_name}'")
-            sagemaker_client.create_model_package_group(
-                ModelPackageGroupName=model_package_group_name
-            )
-            logger.info(f"Model Package Group '{model_package_group_name}' created successfully.")
-    
+        # A describe checks the group directly, regardless of how many groups the account has
+        sagemaker_client.describe_model_package_group(ModelPackageGroupName=model_package_group_name)
+        state['group_created'] = False
+        logger.debug(f"Model Package Group '{model_package_group_name}' already exists.")
     except ClientError as e:
-        logger.error(f"An error occurred while creating Model Package Group: {e}")
-        raise e
+        # Any other error reaches the Lambda runtime, which logs it along with its traceback
+        if e.response['Error']['Code'] not in ('ValidationException', 'ResourceNotFound'):
+            raise
+        # Create the Model Package Group
+        logger.debug(f"Creating Model Package Group with name: '{model_package_group_name}'")
+        sagemaker_client.create_model_package_group(
+            ModelPackageGroupName=model_package_group_name
+        )
+        state['group_created'] = True
+        logger.debug(f"Model Package Group '{model_package_group_name}' created successfully.")
     
     try:
         # Create a model package from the last training job metadata
         last_training_job_model_package_arn = create_model_package(source_bucket,metadata_key, model_package_group_name)
+        state['new_model_package_arn'] = last_training_job_model_package_arn
+        last_training_job_version_properties = get_model_version_properties(last_training_job_model_package_arn)
     
         # Retrieve the ARN of the approved model package
-        try:
-            approved_package = sagemaker_client.list_model_packages(
-                ModelPackageGroupName=model_package_group_name,
-                ModelApprovalStatus='Approved')
-            num_approved_packages = len(approved_package['ModelPackageSummaryList'])
+        # Two summaries are enough to tell none, one and more than one approved packages apart
+        approved_package = sagemaker_client.list_model_packages(
+            ModelPackageGroupName=model_package_group_name,
+            ModelApprovalStatus='Approved',
+            SortBy='CreationTime',
+            MaxResults=2)
+        num_approved_packages = len(approved_package['ModelPackageSummaryList'])
+        state['num_approved'] = num_approved_packages
     
-            if num_approved_packages == 1:
-                logger.info("At least one approved model package exists.")
-                production_model_package_arn = approved_package['ModelPackageSummaryList'][0]['ModelPackageArn']
-            elif num_approved_packages == 0:
-                production_model_package_arn = None
-                logger.info("There are no models in production.")
-            else:
-                production_model_package_arn = None
-                logger.warning("There are more than 1 models in production.")
-                return {
-                    'statusCode':500,
-                    'body':json.dumps({
-                        'message': 'There are more than 1 models in production'
-                    })
-                }
-                
-        except (BotoCoreError, ClientError) as error:
-            logger.error(f"An error occurred in the get_approved_model_package_arn function: {error}")
-        
+        if num_approved_packages == 1:
+            logger.debug("At least one approved model package exists.")
+            production_model_package_arn = approved_package['ModelPackageSummaryList'][0]['ModelPackageArn']
+            state['production_model_package_arn'] = production_model_package_arn
+        elif num_approved_packages == 0:
+            production_model_package_arn = None
+            logger.debug("There are no models in production.")
+        else:
+            production_model_package_arn = None
+            logger.warning("There are more than 1 models in production.")
+            return {
+                'statusCode':500,
+                'body':MULTIPLE_PRODUCTION_MODELS_BODY
+            }
+
         # If there aren't any models in production, the last training job model is set to production
         if not production_model_package_arn:
             sagemaker_client.update_model_package(
                 ModelPackageArn=last_training_job_model_package_arn,
-                ModelApprovalStatus='Approved'
+                ModelApprovalStatus='Approved',
+                CustomerMetadataProperties=last_training_job_version_properties
             )
-            logger.info('First model package approved as there are no existing approved models.')
+            state['best_model'] = 'new'
+            logger.debug('First model package approved as there are no existing approved models.')
             return {
                 'statusCode': 200,
                 'body': json.dumps({
@@ -167,77 +211,99 @@ def lambda_handler(event, context):
                 })
             }
     
-        # Retrieve model metrics
+        # Retrieve model metrics. Both describes are independent, so they run at the same time.
+        production_metric_future = executor.submit(get_model_metric, production_model_package_arn, metric_name, cache=True)
+        last_training_job_metric_future = executor.submit(get_model_metric, last_training_job_model_package_arn, metric_name)
         try:
-            production_model_metric = get_model_metric(production_model_package_arn, metric_name)
+            production_model_metric = production_metric_future.result()
         except Exception as e:
-            logger.error(f"An error occurred with the production_model_metric: {e}")
+            logger.exception("An error occurred with the production_model_metric")
             return {
                 'statusCode': 500,
                 'body': json.dumps({'message': f'Production_model_metric error: {str(e)}'})
             }
         try:   
-            last_training_job_metric = get_model_metric(last_training_job_model_package_arn, metric_name)
+            last_training_job_metric = last_training_job_metric_future.result()
         except Exception as e:
-            logger.error(f"An error occurred with the last_training_job_metric: {e}")
+            logger.exception("An error occurred with the last_training_job_metric")
             return {
                 'statusCode': 500,
                 'body': json.dumps({'message': f'Last_training_job_metric error: {str(e)}'})
             }
     
-        maximize_metrics = ['accuracy','auc','f1','map','ndcg']
-        maximize = any(metric in metric_name for metric in maximize_metrics)
+        # Ranking metrics may carry a cut-off (e.g. 'ndcg@5'), which doesn't change their direction
+        maximize = eval_metric.split('@', 1)[0].lower() in MAXIMIZE_METRICS
         
-        if maximize:
-            logger.info('Comparing maximum metric')
-            # Compare the metrics
-            if float(production_model_metric) > float(last_training_job_metric):
-                best_model = 'production'
-            else:
-                best_model = 'new'
+        production_value = float(production_model_metric)
+        last_training_job_value = float(last_training_job_metric)
+        state['production_value'] = production_value
+        state['new_value'] = last_training_job_value
+        logger.debug(f"Comparing {'maximum' if maximize else 'minimum'} metric")
+        if production_value == last_training_job_value:
+            best_model = 'tie'
         else:
-            logger.info('Comparing minimum metric')
-            if float(production_model_metric) < float(last_training_job_metric):
-                best_model = 'production'
-            else:
-                best_model = 'new'
+            # Compare the metrics
+            production_wins = (production_value > last_training_job_value) if maximize else (production_value < last_training_job_value)
+            best_model = 'production' if production_wins else 'new'
+        state['best_model'] = best_model
     
-        if best_model == 'production':
-            # Update last training job model package from 'PendingManualApproval' to 'Rejected'
+        if best_model == 'tie':
+            # Equal metrics: production stays and the new package is left 'PendingManualApproval'
+            # for a manual decision. Only its version is recorded.
             sagemaker_client.update_model_package(
                 ModelPackageArn=last_training_job_model_package_arn,
-                ModelApprovalStatus='Rejected'
+                CustomerMetadataProperties=last_training_job_version_properties
             )
-            logger.info('Production model remains the best')
+            logger.debug('New model ties with the production model, left pending manual approval')
             return {
                 'statusCode': 200,
-                'body': json.dumps({'message': 'Production model remains the best'}),
+                'body': TIE_BODY,
                 'Production model package:': production_model_package_arn
             }
-        else:
+        elif best_model == 'production':
+            # Update last training job model package from 'PendingManualApproval' to 'Rejected'
             sagemaker_client.update_model_package(
                 ModelPackageArn=last_training_job_model_package_arn,
-                ModelApprovalStatus='Approved'
-            )
-            sagemaker_client.update_model_package(
-                ModelPackageArn=production_model_package_arn,
-                ModelApprovalStatus='Rejected'
+                ModelApprovalStatus='Rejected',
+                CustomerMetadataProperties=last_training_job_version_properties
             )
-            logger.info('New model from last training job is the best now')
+            logger.debug('Production model remains the best')
+            return {
+                'statusCode': 200,
+                'body': PRODUCTION_BEST_BODY,
+                'Production model package:': production_model_package_arn
+            }
+        else:
+            # Approve the new package and reject the production one at the same time. Consuming the
+            # results re-raises the error of a failed update.
+            list(executor.map(lambda update_args: sagemaker_client.update_model_package(**update_args), (
+                {
+                    'ModelPackageArn': last_training_job_model_package_arn,
+                    'ModelApprovalStatus': 'Approved',
+                    'CustomerMetadataProperties': last_training_job_version_properties
+                },
+                {
+                    'ModelPackageArn': production_model_package_arn,
+                    'ModelApprovalStatus': 'Rejected'
+                }
+            )))
+            # The rejected package is no longer compared against
+            metric_cache.pop((production_model_package_arn, metric_name), None)
+            logger.debug('New model from last training job is the best now')
             return {
                 'statusCode': 200,
-                'body': json.dumps({'message': 'New model from last training job is the best now'}),
+                'body': NEW_BEST_BODY,
                 'New best model package:': last_training_job_model_package_arn
             }
     
     except (KeyError, BotoCoreError, ClientError) as error:
-        logger.error(f"An error occurred during model comparison: {error}")
+        logger.exception("An error occurred during model comparison")
         return {
             'statusCode': 500,
             'body': json.dumps({'message': f'Error: {str(error)}'})
         }
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
+        logger.exception("An unexpected error occurred")
         return {
             'statusCode': 500,
             'body': json.dumps({'message': f'Unexpected error: {str(e)}'})